@@ -5,17 +5,38 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from cachetools import TTLCache
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.server_api import ServerApi
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
 from typing import Union, Optional, Dict, Any
 from pydantic import BaseModel
 from bson import ObjectId
+from bson.codec_options import CodecOptions, TypeDecoder, TypeRegistry
 
 # Load environment variables from .env file
 load_dotenv()
 
+UTC = timezone.utc
+
+
+class _ObjectIdDecoder(TypeDecoder):
+    bson_type = ObjectId
+
+    def transform_bson(self, value):
+        return str(value)
+
+
+# Codec options for documents returned straight from the API: ObjectIds become
+# strings while the BSON is decoded; tz-aware datetimes are left for orjson.
+JSON_CODEC_OPTIONS = CodecOptions(
+    document_class=dict,
+    tz_aware=True,
+    type_registry=TypeRegistry([_ObjectIdDecoder()]),
+)
+
 _client = None
 db = None
 
@@ -23,44 +44,134 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # Single pooled client shared by every request; it reuses connections
+    # across the event loop, so building it once avoids handshakes on bursts.
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=100,
+        minPoolSize=10,
+        maxIdleTimeMS=60000,
+        retryWrites=True,
+        # Fail fast when no server is reachable instead of the 30s default,
+        # so the startup ping can't stall boot
+        serverSelectionTimeoutMS=5000,
+        compressors="zstd",
+        server_api=ServerApi("1"),
+    )
     db = _client[database_name]
 
-# Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
-    # Convert Pydantic model to dict if needed
-    if isinstance(data, BaseModel):
-        data_dict = data.model_dump()
-    else:
-        data_dict = data.copy()
+# Short-lived cache of get_documents(cache=True) results. Each write bumps the
+# collection's generation, which is part of the key, so cached reads never
+# outlive a write made through these helpers.
+_query_cache = TTLCache(maxsize=256, ttl=3)
+_collection_generations: Dict[str, int] = {}
+_MISS = object()
+
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+def _invalidate(collection_name: str):
+    _collection_generations[collection_name] = _collection_generations.get(collection_name, 0) + 1
 
-    result = db[collection_name].insert_one(data_dict)
-    return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+def get_db():
+    """Return the database handle or raise if it is not configured"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-    
-    cursor = db[collection_name].find(filter_dict or {})
-    if limit:
-        cursor = cursor.limit(limit)
-    
-    return list(cursor)
+    return db
 
 
-def update_document_by_id(collection_name: str, doc_id: Union[str, ObjectId], update: Dict[str, Any]):
-    """Update a single document by its _id with $set and updated_at timestamp"""
+async def ping_database():
+    """Round-trip a ping to validate the connection (call once at startup)"""
+    if _client is None:
+        return False
+    await _client.admin.command("ping")
+    return True
+
+
+async def ensure_indexes():
+    """Create the indexes the API queries rely on (idempotent; call at startup)"""
     if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+        return
+    # Messages are read per conversation in creation order; _id breaks ties
+    # between messages written in the same bulk insert.
+    await db["chatmessage"].create_index([("conversation_id", 1), ("created_at", 1), ("_id", 1)])
+    await db["conversation"].create_index([("created_at", -1)])
+
+def _to_document(data: Union[BaseModel, dict], now: datetime) -> dict:
+    """Turn a model or dict into an insertable document stamped with `now`.
+    Dicts are stamped in place rather than copied, so callers should pass a
+    freshly built dict."""
+    data_dict = data.model_dump() if isinstance(data, BaseModel) else data
+    data_dict.update(created_at=now, updated_at=now)
+    return data_dict
 
+# Helper functions for common database operations
+async def insert_document(collection_name: str, data: Union[BaseModel, dict]) -> ObjectId:
+    """Insert a single document with timestamp and return its ObjectId.
+    The id is generated client-side (unless given), so callers can pass the
+    ObjectId on to update helpers without re-parsing a string."""
+    data_dict = _to_document(data, datetime.now(UTC))
+    oid = data_dict.setdefault('_id', ObjectId())
+    await get_db()[collection_name].insert_one(data_dict)
+    _invalidate(collection_name)
+    return oid
+
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with timestamp"""
+    return str(await insert_document(collection_name, data))
+
+def find_documents(collection_name: str, filter_dict: dict = None, limit: int = None,
+                   projection: dict = None, sort: list = None,
+                   codec_options: Optional[CodecOptions] = None):
+    """Build a cursor over a collection without fetching anything yet.
+    Iterate it with `async for` to stream documents as batches arrive."""
+    collection = get_db().get_collection(collection_name, codec_options=codec_options)
+    cursor = collection.find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None,
+                        projection: dict = None, sort: list = None,
+                        codec_options: Optional[CodecOptions] = None, cache: bool = False):
+    """Get documents from collection, optionally projected and sorted server-side.
+    Pass codec_options (e.g. JSON_CODEC_OPTIONS) to control how BSON is decoded.
+    With cache=True the result may be served from a short TTL cache; only use it
+    for shared, non user-scoped listings, and don't mutate the returned list."""
+    key = None
+    if cache:
+        try:
+            key = (
+                collection_name,
+                _collection_generations.get(collection_name, 0),
+                frozenset(filter_dict.items()) if filter_dict else (),
+                limit,
+                frozenset(projection.items()) if projection else (),
+                tuple(sort or ()),
+                id(codec_options),
+            )
+            hash(key)
+        except TypeError:
+            # Filters with nested operators aren't hashable; just query
+            key = None
+        if key is not None:
+            # Single lookup: a separate `in` check and read could straddle expiry
+            cached = _query_cache.get(key, _MISS)
+            if cached is not _MISS:
+                return cached
+
+    cursor = find_documents(collection_name, filter_dict, limit, projection, sort, codec_options)
+    # The cursor already carries the limit; 0 or None means no limit, as before
+    docs = await cursor.to_list(length=None)
+    if key is not None:
+        _query_cache[key] = docs
+    return docs
+
+
+async def update_document_by_id(collection_name: str, doc_id: Union[str, ObjectId], update: Dict[str, Any]):
+    """Update a single document by its _id with $set and updated_at timestamp"""
     if isinstance(doc_id, str):
         try:
             doc_id = ObjectId(doc_id)
@@ -68,17 +179,23 @@ def update_document_by_id(collection_name: str, doc_id: Union[str, ObjectId], up
             raise ValueError("Invalid ObjectId string")
 
     update_data = update.copy()
-    update_data['updated_at'] = datetime.now(timezone.utc)
-    res = db[collection_name].update_one({"_id": doc_id}, {"$set": update_data})
+    update_data['updated_at'] = datetime.now(UTC)
+    res = await get_db()[collection_name].update_one({"_id": doc_id}, {"$set": update_data})
+    _invalidate(collection_name)
     return res.modified_count
 
 
-def update_documents(collection_name: str, filter_dict: Dict[str, Any], update: Dict[str, Any]):
-    """Update multiple documents matching a filter"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+async def delete_document_by_id(collection_name: str, doc_id: ObjectId):
+    """Delete a single document by its _id"""
+    res = await get_db()[collection_name].delete_one({"_id": doc_id})
+    _invalidate(collection_name)
+    return res.deleted_count
+
 
+async def update_documents(collection_name: str, filter_dict: Dict[str, Any], update: Dict[str, Any]):
+    """Update multiple documents matching a filter"""
     update_data = update.copy()
-    update_data['updated_at'] = datetime.now(timezone.utc)
-    res = db[collection_name].update_many(filter_dict, {"$set": update_data})
+    update_data['updated_at'] = datetime.now(UTC)
+    res = await get_db()[collection_name].update_many(filter_dict, {"$set": update_data})
+    _invalidate(collection_name)
     return res.modified_count
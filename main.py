@@ -1,16 +1,58 @@
 import os
+import re
 import time
-from typing import Optional, Literal, List, Dict, Any
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional, Literal, List, Dict, Any, AsyncIterator
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+import orjson
+
+from cachetools import LRUCache
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from bson import ObjectId
 
-from database import db, create_document, get_documents, update_document_by_id, update_documents
+from database import db, get_db, JSON_CODEC_OPTIONS, ping_database, ensure_indexes, insert_document, find_documents, get_documents, update_document_by_id, delete_document_by_id, update_documents
 from schemas import VideoRequest, Conversation, ChatMessage
 
-app = FastAPI(title="AI Video + Volt Chat API")
+logger = logging.getLogger(__name__)
+
+# Environment is fixed for the lifetime of the process
+DATABASE_URL_STATUS = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
+DATABASE_NAME_STATUS = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+VEO3_API_KEY = os.getenv("VEO3_API_KEY")
+PORT = int(os.getenv("PORT", "8000"))
+
+# Cap on concurrently running background jobs, so a burst of requests can't
+# flood the event loop or exhaust the database connection pool
+BG_CONCURRENCY = int(os.getenv("BG_CONCURRENCY", "32"))
+BG_SEMAPHORE = asyncio.Semaphore(BG_CONCURRENCY)
+
+# How long the /test database report is reused before re-querying
+TEST_CACHE_SECONDS = 30
+_database_report_cache: Dict[int, Dict[str, Any]] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Validate the pooled connection once at startup rather than at import,
+    # so a slow or unreachable database doesn't block module loading.
+    try:
+        await ping_database()
+        await ensure_indexes()
+    except Exception as e:
+        logger.warning("Database setup failed at startup: %s", e)
+    yield
+
+
+app = FastAPI(
+    title="AI Video + Volt Chat API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,13 +80,12 @@ class SendMessagePayload(BaseModel):
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Backend Ready: Video Generator + Volt Chat"}
 
 
-@app.get("/test")
-def test_database():
-    """Test endpoint to check if database is available and accessible"""
+async def _database_report() -> Dict[str, Any]:
+    """Build the /test report (one list_collection_names round-trip)"""
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -60,7 +101,7 @@ def test_database():
             response["database_name"] = getattr(db, 'name', '✅ Connected')
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -70,11 +111,24 @@ def test_database():
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:50]}"
 
-    response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-    response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+    response["database_url"] = DATABASE_URL_STATUS
+    response["database_name"] = DATABASE_NAME_STATUS
     return response
 
 
+@app.get("/test")
+async def test_database():
+    """Test endpoint to check if database is available and accessible"""
+    # Reuse the report for the current cache window so polling doesn't hit the DB
+    bucket = int(time.time() // TEST_CACHE_SECONDS)
+    report = _database_report_cache.get(bucket)
+    if report is None:
+        report = await _database_report()
+        _database_report_cache.clear()
+        _database_report_cache[bucket] = report
+    return report
+
+
 # -------------------- Video generation (existing) --------------------
 
 def _simulate_thumbnail(video_url: str) -> str:
@@ -82,51 +136,51 @@ def _simulate_thumbnail(video_url: str) -> str:
     return video_url + "#thumb.jpg"
 
 
-def process_veo3_job(request_id: str, payload: GeneratePayload):
+async def process_veo3_job(request_id: ObjectId, payload: GeneratePayload):
     """Simulate Veo3 job submission and completion using an API key from env.
     Replace this with a real provider SDK/HTTP flow when available.
     """
-    try:
-        api_key = os.getenv("VEO3_API_KEY")
-        if not api_key:
-            update_document_by_id(
+    async with BG_SEMAPHORE:
+        try:
+            if not VEO3_API_KEY:
+                await update_document_by_id(
+                    "videorequest",
+                    request_id,
+                    {"status": "failed", "error": "VEO3_API_KEY not configured on server"}
+                )
+                return
+
+            # Mark as processing
+            await update_document_by_id("videorequest", request_id, {"status": "processing"})
+
+            # Simulate network/processing latency
+            await asyncio.sleep(2)
+
+            # Here you would call the real Veo3 API using `VEO3_API_KEY` and `payload`
+            # For now we simulate a successful generation with a mock URL
+            mock_video_url = f"https://cdn.example.com/generated/{request_id}.mp4"
+            mock_thumb_url = _simulate_thumbnail(mock_video_url)
+
+            await update_document_by_id(
                 "videorequest",
                 request_id,
-                {"status": "failed", "error": "VEO3_API_KEY not configured on server"}
+                {
+                    "status": "completed",
+                    "generated_url": mock_video_url,
+                    "thumbnail_url": mock_thumb_url,
+                    "error": None,
+                },
+            )
+        except Exception as e:
+            await update_document_by_id(
+                "videorequest",
+                request_id,
+                {"status": "failed", "error": str(e)[:500]},
             )
-            return
-
-        # Mark as processing
-        update_document_by_id("videorequest", request_id, {"status": "processing"})
-
-        # Simulate network/processing latency
-        time.sleep(2)
-
-        # Here you would call the real Veo3 API using `api_key` and `payload`
-        # For now we simulate a successful generation with a mock URL
-        mock_video_url = f"https://cdn.example.com/generated/{request_id}.mp4"
-        mock_thumb_url = _simulate_thumbnail(mock_video_url)
-
-        update_document_by_id(
-            "videorequest",
-            request_id,
-            {
-                "status": "completed",
-                "generated_url": mock_video_url,
-                "thumbnail_url": mock_thumb_url,
-                "error": None,
-            },
-        )
-    except Exception as e:
-        update_document_by_id(
-            "videorequest",
-            request_id,
-            {"status": "failed", "error": str(e)[:500]},
-        )
 
 
 @app.post("/api/generate")
-def queue_generation(payload: GeneratePayload, background: BackgroundTasks):
+async def queue_generation(payload: GeneratePayload, background: BackgroundTasks):
     """
     Queue a video generation job. When model is 'veo3', we trigger a background task
     that simulates a provider call using an API key from the environment.
@@ -139,162 +193,245 @@ def queue_generation(payload: GeneratePayload, background: BackgroundTasks):
             aspect_ratio=payload.aspect_ratio,
             status="queued",
         )
-        inserted_id = create_document("videorequest", record)
+        inserted_id = await insert_document("videorequest", record)
 
         # Kick off background processing per model
         if payload.model == "veo3":
             background.add_task(process_veo3_job, inserted_id, payload)
         # For sora2, keep it queued for now (reserved for future integration)
 
-        return {"request_id": inserted_id, "status": "queued"}
+        return {"request_id": str(inserted_id), "status": "queued"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Fields returned by the list endpoints; everything else stays in the database
+VIDEO_REQUEST_PROJECTION = {
+    "prompt": 1, "model": 1, "status": 1, "generated_url": 1, "thumbnail_url": 1,
+    "error": 1, "created_at": 1, "updated_at": 1,
+}
+
+
 @app.get("/api/requests")
-def list_requests(limit: int = 20):
+async def list_requests(limit: int = 20):
     try:
-        docs = get_documents("videorequest", {}, limit)
-        # Convert ObjectId to string for JSON
-        for d in docs:
-            if "_id" in d and isinstance(d["_id"], ObjectId):
-                d["_id"] = str(d["_id"])
-            # Convert datetimes to isoformat if present
-            for k in ["created_at", "updated_at"]:
-                if k in d and hasattr(d[k], "isoformat"):
-                    d[k] = d[k].isoformat()
-        return {"items": docs}
+        # ObjectIds are decoded straight to strings; orjson encodes the datetimes
+        docs = await get_documents(
+            "videorequest",
+            {},
+            limit,
+            projection=VIDEO_REQUEST_PROJECTION,
+            codec_options=JSON_CODEC_OPTIONS,
+            cache=True,
+        )
+        # Returning the response directly skips FastAPI's jsonable_encoder pass
+        return ORJSONResponse({"items": docs})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/hello")
-def hello():
+async def hello():
     return {"message": "Hello from the backend API!"}
 
 
 # -------------------- Volt Chatbot --------------------
 
-def _oid(oid_str: str) -> ObjectId:
+CONVERSATION_PROJECTION = {"title": 1, "created_by": 1, "created_at": 1, "updated_at": 1}
+CHAT_MESSAGE_PROJECTION = {"role": 1, "content": 1, "created_at": 1}
+
+
+# Messages mentioning any of these get Volt's capability overview. A single
+# compiled alternation scans the text once for all keywords.
+HELP_KEYWORDS = ["help", "what can you do", "commands", "features"]
+_HELP_PATTERN = re.compile("|".join(map(re.escape, HELP_KEYWORDS)))
+
+# Conversations are never deleted, so once one is seen it stays valid
+_known_conversations = LRUCache(maxsize=4096)
+
+
+async def _oid(conversation_id: str) -> ObjectId:
+    """Dependency that parses the conversation id path parameter once per request"""
     try:
-        return ObjectId(oid_str)
+        return ObjectId(conversation_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid conversation id")
 
 
-def process_volt_reply(conversation_id: str, user_text: str):
+async def _conversation_exists(conv_id: ObjectId) -> bool:
+    if conv_id in _known_conversations:
+        return True
+    doc = await get_db()["conversation"].find_one({"_id": conv_id}, projection={"_id": 1})
+    if doc is None:
+        return False
+    _known_conversations[conv_id] = True
+    return True
+
+
+async def process_volt_reply(conversation_id: ObjectId, user_text: str):
     """Generate a lightweight assistant reply for Volt.
     This simulates an AI model; replace with a real LLM provider when desired.
+    Both inputs were validated at the API boundary (the id by `_oid`, the text
+    by SendMessagePayload), so the reply is built with model_construct.
     """
-    try:
-        # Optional: simulate thinking time
-        time.sleep(0.8)
-
-        # Simple, friendly heuristic reply
-        prefix = "⚡ Volt"
-        guidance = (
-            "I’m your open-source AI co-pilot. I can help with creative prompts,"
-            " coding tips, and product ideas. Ask me anything!"
-        )
-        if len(user_text.strip()) < 4:
-            reply = f"{prefix}: Could you share a bit more detail? {guidance}"
-        elif any(k in user_text.lower() for k in ["help", "what can you do", "commands", "features"]):
-            reply = (
-                f"{prefix}: Here’s what I can do right now:\n"
-                "- Brainstorm prompts for your video generator (Veo3/Sora2).\n"
-                "- Explain code and APIs in simple terms.\n"
-                "- Outline product ideas and next steps.\n"
-                "- Keep track of our chat in this conversation."
+    async with BG_SEMAPHORE:
+        try:
+            # Optional: simulate thinking time
+            await asyncio.sleep(0.8)
+
+            # Simple, friendly heuristic reply
+            prefix = "⚡ Volt"
+            guidance = (
+                "I’m your open-source AI co-pilot. I can help with creative prompts,"
+                " coding tips, and product ideas. Ask me anything!"
             )
-        else:
-            reply = f"{prefix}: {user_text.strip()} — interesting! Here’s a concise suggestion: " \
-                    f"break it into steps, try a quick prototype, and iterate. I can sketch steps if you want."
-
-        # Store assistant message
-        create_document("chatmessage", ChatMessage(
-            conversation_id=conversation_id,
-            role="assistant",
-            content=reply,
-        ))
-    except Exception as e:
-        # Store failure as assistant message to surface errors in the UI
-        create_document("chatmessage", ChatMessage(
-            conversation_id=conversation_id,
-            role="assistant",
-            content=f"⚡ Volt: Oops, I hit an error: {str(e)[:300]}",
-        ))
+            if len(user_text.strip()) < 4:
+                reply = f"{prefix}: Could you share a bit more detail? {guidance}"
+            elif _HELP_PATTERN.search(user_text.lower()):
+                reply = (
+                    f"{prefix}: Here’s what I can do right now:\n"
+                    "- Brainstorm prompts for your video generator (Veo3/Sora2).\n"
+                    "- Explain code and APIs in simple terms.\n"
+                    "- Outline product ideas and next steps.\n"
+                    "- Keep track of our chat in this conversation."
+                )
+            else:
+                reply = f"{prefix}: {user_text.strip()} — interesting! Here’s a concise suggestion: " \
+                        f"break it into steps, try a quick prototype, and iterate. I can sketch steps if you want."
+        except Exception as e:
+            # Store failure as assistant message to surface errors in the UI
+            reply = f"⚡ Volt: Oops, I hit an error: {str(e)[:300]}"
+
+        # Store assistant message; nobody awaits this task, so log failures
+        try:
+            await insert_document("chatmessage", ChatMessage.model_construct(
+                conversation_id=conversation_id,
+                role="assistant",
+                content=reply,
+            ))
+        except Exception:
+            logger.exception("Failed to store Volt reply for conversation %s", conversation_id)
 
 
 @app.post("/api/chat/conversations")
-def create_conversation(payload: CreateConversationPayload):
+async def create_conversation(payload: CreateConversationPayload):
     title = payload.title or "New Chat"
     conv = Conversation(title=title, created_by=payload.created_by)
-    conv_id = create_document("conversation", conv)
+    # Generate the id client-side so the greeting doesn't have to wait for
+    # the conversation insert; both writes then go out concurrently.
+    conv_oid = ObjectId()
     # Seed with a greeting from Volt
     greeting = (
         "⚡ Volt: Hi! I’m Volt, an open-source AI chat companion. "
         "Tell me what you’re building and I’ll help you plan, write, and ship."
     )
-    create_document("chatmessage", ChatMessage(
-        conversation_id=conv_id,
-        role="assistant",
-        content=greeting,
-    ))
-    return {"conversation_id": conv_id, "title": title}
+    conv_result, greeting_result = await asyncio.gather(
+        insert_document("conversation", {**conv.model_dump(), "_id": conv_oid}),
+        insert_document("chatmessage", ChatMessage.model_construct(
+            conversation_id=conv_oid,
+            role="assistant",
+            content=greeting,
+        )),
+        return_exceptions=True,
+    )
+    if isinstance(conv_result, BaseException):
+        # Don't leave a greeting pointing at a conversation that was never stored
+        if not isinstance(greeting_result, BaseException):
+            try:
+                await delete_document_by_id("chatmessage", greeting_result)
+            except Exception:
+                logger.exception("Failed to remove orphaned greeting %s", greeting_result)
+        raise conv_result
+    if isinstance(greeting_result, BaseException):
+        raise greeting_result
+    _known_conversations[conv_oid] = True
+    return {"conversation_id": str(conv_oid), "title": title}
 
 
 @app.get("/api/chat/conversations")
-def list_conversations(limit: int = 20):
-    docs = get_documents("conversation", {}, limit)
-    for d in docs:
-        if "_id" in d and isinstance(d["_id"], ObjectId):
-            d["_id"] = str(d["_id"])
-        for k in ["created_at", "updated_at"]:
-            if k in d and hasattr(d[k], "isoformat"):
-                d[k] = d[k].isoformat()
-    return {"items": docs}
+async def list_conversations(limit: int = 20):
+    docs = await get_documents(
+        "conversation",
+        {},
+        limit,
+        projection=CONVERSATION_PROJECTION,
+        sort=[("created_at", -1)],
+        codec_options=JSON_CODEC_OPTIONS,
+        cache=True,
+    )
+    return ORJSONResponse({"items": docs})
+
+
+async def _stream_items(first: Optional[Dict[str, Any]], cursor) -> AsyncIterator[bytes]:
+    """Encode `{"items": [...]}` one document at a time as the cursor yields,
+    so the full list is never held in memory. `first` is the document already
+    pulled from the cursor (None if it was empty)."""
+    yield b'{"items":['
+    if first is not None:
+        yield orjson.dumps(first)
+        async for doc in cursor:
+            yield b"," + orjson.dumps(doc)
+    yield b"]}"
 
 
 @app.get("/api/chat/conversations/{conversation_id}/messages")
-def list_messages(conversation_id: str, limit: int = 100):
-    docs = get_documents("chatmessage", {"conversation_id": conversation_id}, limit)
-    for d in docs:
-        if "_id" in d and isinstance(d["_id"], ObjectId):
-            d["_id"] = str(d["_id"])
-        for k in ["created_at", "updated_at"]:
-            if k in d and hasattr(d[k], "isoformat"):
-                d[k] = d[k].isoformat()
-    # Sort by created_at if present
-    docs.sort(key=lambda x: x.get("created_at", 0))
-    return {"items": docs}
+async def list_messages(
+    conversation_id: str,
+    limit: int = 100,
+    conversation_oid: ObjectId = Depends(_oid),
+):
+    cursor = find_documents(
+        "chatmessage",
+        # Also match the legacy string form until migrate_conversation_ids.py has run
+        {"conversation_id": {"$in": [conversation_oid, str(conversation_oid)]}},
+        limit,
+        projection=CHAT_MESSAGE_PROJECTION,
+        sort=[("created_at", 1), ("_id", 1)],
+        codec_options=JSON_CODEC_OPTIONS,
+    )
+    # Run the query (first batch) before any headers are sent, so database
+    # errors still produce an error status instead of a truncated 200
+    try:
+        first = await cursor.next()
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(_stream_items(first, cursor), media_type="application/json")
 
 
 @app.post("/api/chat/conversations/{conversation_id}/messages")
-def send_message(conversation_id: str, payload: SendMessagePayload, background: BackgroundTasks):
-    # Ensure conversation exists (simple check)
+async def send_message(
+    conversation_id: str,
+    payload: SendMessagePayload,
+    background: BackgroundTasks,
+    conversation_oid: ObjectId = Depends(_oid),
+):
+    # Ensure conversation exists; only the first message to it costs a lookup
     try:
-        _ = db["conversation"].find_one({"_id": _oid(conversation_id)})
-        if _ is None:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-    except HTTPException:
-        raise
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid conversation id")
+        exists = await _conversation_exists(conversation_oid)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not exists:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
-    # Store user message
-    create_document("chatmessage", ChatMessage(
-        conversation_id=conversation_id,
-        role="user",
-        content=payload.content,
-    ))
+    # Store user message before responding, so it is listed (and timestamped)
+    # right away and a failed write is reported to the client
+    try:
+        await insert_document("chatmessage", ChatMessage.model_construct(
+            conversation_id=conversation_oid,
+            role="user",
+            content=payload.content,
+        ))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
     # Trigger assistant response
-    background.add_task(process_volt_reply, conversation_id, payload.content)
+    background.add_task(process_volt_reply, conversation_oid, payload.content)
 
     return {"ok": True}
 
 
 if __name__ == "__main__":
     import uvicorn
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
@@ -0,0 +1,32 @@
+"""
+Migration: store chatmessage.conversation_id as ObjectId
+
+Messages written before ChatMessage.conversation_id became an ObjectId hold
+the id as a hex string. This converts them in place on the server. It is safe
+to run repeatedly: converted documents no longer match the filter, and strings
+that aren't valid ObjectIds are left unchanged.
+
+Run with: python migrate_conversation_ids.py
+"""
+
+import asyncio
+
+from database import get_db
+
+
+async def migrate_conversation_ids() -> int:
+    """Convert string conversation ids to ObjectId; returns documents changed"""
+    res = await get_db()["chatmessage"].update_many(
+        {"conversation_id": {"$type": "string"}},
+        [{"$set": {"conversation_id": {"$convert": {
+            "input": "$conversation_id",
+            "to": "objectId",
+            "onError": "$conversation_id",
+        }}}}],
+    )
+    return res.modified_count
+
+
+if __name__ == "__main__":
+    modified = asyncio.run(migrate_conversation_ids())
+    print(f"Converted conversation_id on {modified} chat messages")
@@ -11,8 +11,27 @@ Model name is converted to lowercase for the collection name:
 - BlogPost -> "blogs" collection
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from pydantic import BaseModel, ConfigDict, Field, BeforeValidator, PlainSerializer, WithJsonSchema
+from typing import Optional, Literal, Annotated
+from bson import ObjectId
+
+
+def _parse_object_id(v):
+    # Accept hex strings; anything else must already be an ObjectId
+    if isinstance(v, str):
+        if not ObjectId.is_valid(v):
+            raise ValueError("Invalid ObjectId")
+        return ObjectId(v)
+    return v
+
+
+# ObjectId stored natively in MongoDB, shown as a hex string in JSON output/schemas
+PyObjectId = Annotated[
+    ObjectId,
+    BeforeValidator(_parse_object_id),
+    PlainSerializer(str, return_type=str, when_used="json"),
+    WithJsonSchema({"type": "string", "description": "MongoDB ObjectId (24 hex characters)"}),
+]
 
 # Example schemas (you can keep these for reference or remove later)
 class User(BaseModel):
@@ -68,6 +87,8 @@ class ChatMessage(BaseModel):
     Stores a single chat message
     Collection name: "chatmessage"
     """
-    conversation_id: str = Field(..., description="ID of the conversation this message belongs to")
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    conversation_id: PyObjectId = Field(..., description="ID of the conversation this message belongs to")
     role: Literal["user", "assistant", "system"] = Field(..., description="Message role")
     content: str = Field(..., description="Text content of the message")